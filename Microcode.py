@@ -1,5 +1,8 @@
 
-from collections import defaultdict
+import struct
+import sys
+from array import array
+from collections import defaultdict, deque
 
 # Microcode ROMs order is denoted by a letter A-F.
 # They are arranged from MSB to LSB: ABCDEFH
@@ -12,53 +15,249 @@ from collections import defaultdict
 # E 16 MWM2
 # F 8  MWJ2
 # H 0  MWE2
+
+MASK1  = 0x1
+MASK2  = 0x3
+MASK3  = 0x7
+MASK4  = 0xF
+MASK11 = 0x7FF
+
+# Microword fields: name, starting bit, mask
+FIELDS = [
+    # DP bus control
+    ('d2d3',    0,  MASK4),
+    # F bus control
+    ('e6',      4,  MASK3),
+    # Write control
+    ('k11',     7,  MASK3),
+    # Bus control function
+    ('h11',     10, MASK3),
+    ('e7',      13, MASK2),
+    # Sequencer jsr logic
+    ('jsr',     15, MASK1),
+    # Din for sequencers
+    ('dest',    16, MASK11),
+    # Stack control for sequencers
+    ('fe',      27, MASK1),
+    ('pup',     28, MASK1),
+    # S1, S0 lines of sequencers are derived using some extra logic
+    ('seq0_s',  29, MASK2),
+    ('sh0',     31, MASK1),
+    ('mw_c40',  32, MASK1),
+    # Switch statement and condition selector
+    ('case_',   33, MASK1),
+    # Note that 'cond' reuses middle 4 bits of 'dest'
+    ('cond',    20, MASK4),
+    # ALU control
+    ('aluSrc',  34, MASK3),
+    ('aluOp',   37, MASK3),
+    ('aluDest', 40, MASK3),
+    ('aluB',    43, MASK4),
+    ('aluA',    47, MASK4),
+    # ALU.CARRY_IN and shift select
+    ('u_f6',    51, MASK2),
+    # U_D101A, LSB access for 16-bit register
+    ('r16_lsb', 53, MASK1),
+    # Extra bit for sequencer control, see below
+    ('mw_a6',   54, MASK1),
+    # Register bank selector (explicit or CPL)
+    ('mw_a7',   55, MASK1),
+]
+
+# S1, S0 lines of sequencers are derived from a few microword bits using some
+# extra logic. Precompute them for every combination of these bits, indexed by
+# (mw_a6 << 4) | (mw_c40 << 3) | (sh0 << 2) | seq0_s
+def makeS1S0Map():
+    table = []
+    for index in range(32):
+        seq0_s = (index & 3) ^ 3        # U_L6A, U_L6D
+        sh0    = ((index >> 2) & 1) ^ 1 # U_K6A
+        mw_c40 = (index >> 3) & 1
+        mw_a6  = index >> 4
+        s21  = mw_c40 ^ 1               # U_K6B
+        s11  = mw_a6 & (mw_c40 ^ 1)     # U_J6C, U_K6D, U_K6C
+        table.append((s21 << 9) | (sh0 << 8) | (s11 << 5) | (sh0 << 4) | seq0_s)
+    return table
+
+S1S0_MAP = makeS1S0Map()
+
+# Widths of the disassembly columns, the last one (Seq) isn't padded.
+# Decoders return their columns already padded, so a line is simply joined.
+ADDR_WIDTH    = 4
+DP_WIDTH      = 19
+ALU_CIN_WIDTH = 9
+ALU_OP_WIDTH  = 40
+F_WIDTH       = 51
+BUS_WIDTH     = 11
+EXTRA_WIDTH   = 11
+WRITE_WIDTH   = 20
+LSB_WIDTH     = 7
+
+# Full line layout, used for the header: address, DP, ALUCIn, ALUOp, F,
+# BusControl, BusExtra, WriteCtl, R16_LSB, Seq
+LINE_FORMAT = ' '.join(f'%-{width}s' for width in (ADDR_WIDTH, DP_WIDTH, ALU_CIN_WIDTH, ALU_OP_WIDTH, F_WIDTH,
+                                                   BUS_WIDTH, EXTRA_WIDTH, WRITE_WIDTH, LSB_WIDTH)) + ' %s'
+
+def padded(width, table):
+    return [s if s is None else s.ljust(width) for s in table]
+
+# DP bus sources, None marks the ones decoded at runtime
+DP_BUS_MAP = padded(DP_WIDTH, ['READ.SWP', None, 'READ.MAR.H', 'READ.MAR.L', 'READ.SWP  ', None, 'READ.MAR.H', 'READ.MAR.L',
+                               'READ.PF', 'READ.CCR', 'READ.D.BUS', 'READ.MSR', 'READ.INR', None, '', ''])
+
+# U_F6
+CARRY_MAP = padded(ALU_CIN_WIDTH, ['0', '1', 'FLR.C', '0'])
+
+# U_C14, indexed by mw_a7
+REG_FILE_MAP = ['RF[RIR]', 'RF[RIR.L][ILR]']
+
+# U_H11
+BUS_MAP = padded(BUS_WIDTH, ['', 'BUS.RD', 'BUS.WT', 'LOAD.WAR.H', 'INC.WAR', 'INC.MAR', 'MAPROM.EN', 'LOAD.SWP'])
+
+# U_E7
+EXTRA_F_MAP = padded(EXTRA_WIDTH, ['', 'BUS.ABT', 'LOAD.FLR', 'BUS.WAIT'])
+
+# U_E6
+RESULT_MAP = padded(F_WIDTH, ['        ', "LOAD.RR ", "LOAD.RIR", "LOAD.ILR", "LOAD.MAP", "LOAD.MAR", "LOAD.SAR"])
+
+# CCR flag sources, the link and fault ones are only used when enabled
+# U_J12.a
+SIGN_TABLE = ['CCR.M', 'FLR.S', 'RR.D6', 'FLR.S']
+# U_J12.b
+ZERO_TABLE = ['CCR.V', 'FLR.Z', 'RR.D7', 'FLR.Z&FLR.LZ']
+# U_J10
+LINK_TABLE = ['CCR.L', '/CCR.L', 'FLR.C', '1', 'RR.D4', 'ALU.SHIFT_RAM7', 'ALU_SHIFT_RAM0_Q7', 'ALU.SHIFT_Q0']
+# U_J11
+FAULT_TABLE = ['RR.D5', '1', 'CCR.F', 'FLR.OVER']
+
+# ALU register file operand names
+REG_NAMES = tuple(f'r{reg}' for reg in range(16))
+
+# ALU operand sources (R, S), indexed by aluSrc
+ALU_SRC_MAP = [['A', 'Q'], ['A', 'B'], ['0', 'Q'], ['0', 'B'], ['0', 'A'], ['D', 'A'], ['D', 'Q'], ['D', '0']]
+
+# ALU functions and destination control, indexed by aluOp and aluDest.
+# These are called with already decoded operands, which is cheaper than
+# str.format() on a template.
+ALU_OP_MAP       = [lambda r, s: f'{r}+{s}'   , lambda r, s: f'{s}-{r}'   , lambda r, s: f'{r}-{s}', lambda r, s: f'{r}|{s}',
+                    lambda r, s: f'{r}&{s}'   , lambda r, s: f'(~{r})&{s}', lambda r, s: f'{r}^{s}', lambda r, s: f'~({r}^{s})']
+ALU_MEM_DEST_MAP = [lambda b, f: ''             , lambda b, f: ''             ,
+                    lambda b, f: f'{b}={f}'     , lambda b, f: f'{b}={f}'     ,
+                    lambda b, f: f'{b}=({f})>>1', lambda b, f: f'{b}=({f})>>1',
+                    lambda b, f: f'{b}=({f})<<1', lambda b, f: f'{b} =({f})<<1']
+ALU_Q_DEST_MAP   = [lambda f: f'Q={f}', lambda f: ''     , lambda f: ''     , lambda f: '',
+                    lambda f: 'Q>>=1' , lambda f: ''     , lambda f: 'Q<<=1', lambda f: '']
+ALU_OUT_MAP      = [lambda f, a: f'Y={f}', lambda f, a: f'Y={f}', lambda f, a: f'Y={a}', lambda f, a: f'Y={f}',
+                    lambda f, a: f'Y={f}', lambda f, a: f'Y={f}', lambda f, a: f'Y={f}', lambda f, a: f'Y={f}']
+
+# Switch conditions: name and step between the branches
+SWITCH_MAP = {
+    # The first 4 branches use OR lines 0 and 1 via U_J13
+    0b1100: ('flags(ZM)',     1),
+    0b1101: ('flags(VH)',     1),
+    0b1110: ('pagetable???',  1),
+    # These branches use OR lines 2 and 3 via U_K13
+    0b0011: ('flags(IL)',     4),
+    0b0111: ('interrupts???', 4),
+    0b1011: ('dma???',        4),
+}
+
+# Conditional jsr, indexed by the low 3 bits of the destination
+JSR_COND = ['Cycle', 'RegIdx & 0x11 == 0', 'RegIdx & 1', 'REG_MMIO', 'RegOrPageOut', 'DMARequest', 'MemFault', 'MultiINT']
+
+# U_H6, left shift: signal shifted in at Q0
+SHIFT_Q0_MAP = ['0', 'FLR.C', 'ALU.S', '1']
+# U_H6, right shift: signal shifted in at RAM7
+SHIFT_RAM7_MAP = ['ALU.S', 'FLR.C', 'ALU.Q0', 'ALU.C']
+
+# U_M13
+M13_MAP = ['CTL0.DMA', 'CTL1.DMA', 'TIMER', 'MAPROM.CE1', 'RUN', '/TIMER.RES', 'ABORT', 'IACK']
+# U_F11
+F11_MAP = ['INT', '/ABE', '/INC.DMA', 'DIR', '/DMA', 'PARO', 'PE.EN', 'DMA.EN']
+# U_K11; M13, F11 and REGS are decoded separately
+WRITE_CONTROL = ['', 'DMA.RESET', 'M13.EN?', 'F11.EN?', 'WRITE.RF', 'WRITE.PF', 'LOAD.WAR.L', 'LOAD.DBR']
+
+# U_D101A, indexed by r16_lsb
+LSB_MAP = padded(LSB_WIDTH, ['', 'LSB'])
+
+# Labels for opcode entry points
+OP_LABELS = tuple(f'Op_{opcode:02x}' for opcode in range(256))
+
 class MicroCode(object):
     def __init__(self):
         with open('CodeROM.txt') as f:
-            lines = f.readlines()
-            self.code = [int(line, 16) for line in lines]
-            self.visited = set()
-            self.selects = defaultdict(int)
-
-        self.entries = [0]
+            # Microwords are 56 bits, 14 hex digits per line. Pad every word to
+            # 64 bits, so that the whole ROM is unpacked by a single call.
+            rom = bytes.fromhex('00' + f.read().rstrip().replace('\n', '00'))
+            self.code = list(struct.unpack(f'>{len(rom) // 8}Q', rom))
+            self.visited = bytearray(len(self.code))
+            # Formatted addresses, these prefix every line
+            self.addrStr = [f'{addr:3x}:'.ljust(ADDR_WIDTH) for addr in range(len(self.code))]
+            self.aluCache = {}
+            # Decoded columns, except the sequencer one, for every distinct word
+            self.wordCache = {}
+            # Output lines, written out in one go when we're done
+            self.out = []
+
+        self.fields = self.decodeFields()
+        # Mux select distribution over all used microwords, s1s0 is 10 bits wide
+        self.selects = array('i', [0]) * 1024
+        for word, s1s0 in zip(self.code, self.fields['s1s0']):
+            if word != 0:
+                self.selects[s1s0] += 1
+        # Only a handful of select combinations occur, decode each of them once
+        self.seqMasks = {s1s0: self.decodeSelects(s1s0) for s1s0 in set(self.fields['s1s0'])}
+
+        self.entries = deque([0])
         
         # Parse opcode map and generate labels
         with open('CPU-6309.txt') as f:
-            lines = f.readlines()
-            opc_map = [int(line, 16) for line in lines]
-            self.labels = {}
+            opc_map = bytes.fromhex(f.read())
+            self.labels = defaultdict(list)
             for opcode, addr in enumerate(opc_map):
                 # Two low nibbles come from AR, which comes from the map ROM;
                 # the third nibble is hardcoded to 0x1 (see addr 102)
                 addr += 0x100
-                self.addLabel(addr, f'Op_{opcode:02x}')
+                self.addLabel(addr, OP_LABELS[opcode])
                 self.entries.append(addr)
 
     def addLabel(self, addr, text):
-        if not addr in self.labels:
-            self.labels[addr] = []
         self.labels[addr].append(text)
 
-    def getBits(self, word, start, size):
-        return (word >> start) & (~(-1 << size))
+    # Decode all the fields of all the microwords in one go, producing a column
+    # per field. decodeColumns() and disassembleOne() then simply pick their row
+    # from these columns.
+    def decodeFields(self):
+        code = self.code
+        fields = {name: [(word >> start) & mask for word in code] for name, start, mask in FIELDS}
+
+        # S inputs for sequencers
+        fields['s1s0'] = [S1S0_MAP[(mw_a6 << 4) | (mw_c40 << 3) | (sh0 << 2) | seq0_s]
+                          for seq0_s, sh0, mw_c40, mw_a6 in zip(fields['seq0_s'], fields['sh0'], fields['mw_c40'], fields['mw_a6'])]
+
+        return fields
 
     def getNextNotVisited(self, addr):
-        for i in range(addr, len(self.code)):
-            if not i in self.visited:
-                return i;
-        return None
+        i = self.visited.find(0, addr)
+        return None if i < 0 else i
 
     def disassembleEntries(self):
         while len(self.entries) > 0:
-            addr = self.entries.pop(0)
+            addr = self.entries.popleft()
 
             # Do not print empty lines for already visited entries
-            if addr in self.visited:
+            if self.visited[addr]:
                 continue
-            while not (addr is None or addr in self.visited):
-                self.visited.add(addr)
-                addr = self.disassembleOne(addr, self.code[addr])
-            print()
+            while not (addr is None or self.visited[addr]):
+                self.visited[addr] = 1
+                word = self.code[addr]
+                if word == 0:
+                    # Nothing to decode here, and the flow can't continue past it
+                    self.printLabels(addr)
+                    self.out.append(self.addrStr[addr] + ' unused')
+                    break
+                addr = self.disassembleOne(addr, word)
+            self.out.append('')
 
     def disassemble(self):
         self.printHeader()
@@ -79,79 +278,71 @@ class MicroCode(object):
             # We have definitely visited 'addr', so resume from the next one
             addr = addr + 1
                 
-        print('Mux select distribution')
-        for name, value in self.selects.items():
-            print(f'{name:3x}: {value}')
-
+        self.out.append('Mux select distribution')
+        for name, value in enumerate(self.selects):
+            if value:
+                self.out.append(f'{name:3x}: {value}')
+
+        self.out.append('')
+        sys.stdout.write('\n'.join(self.out))
+        self.out.clear()
+
+    def printLabels(self, addr):
+        # Use get() so that the defaultdict doesn't grow an entry for every address
+        labels = self.labels.get(addr)
+        if labels:
+            for l in labels:
+                self.out.append(l + ':')
+
+    # Unused (zero) words are handled by disassembleEntries()
     def disassembleOne(self, addr, word):
-        if addr in self.labels:
-            for l in self.labels[addr]:
-                print(l + ':')
-        if word == 0:
-            print(f'{addr:3x}: unused')
-            return None
-
-        # DP bus control
-        d2d3    = self.getBits(word, 0, 4)
-        # F bus control
-        e6      = self.getBits(word, 4, 3)
-        # Write control
-        k11     = self.getBits(word, 7, 3)
-        # Bus control function
-        h11     = self.getBits(word, 10, 3)
-        e7      = self.getBits(word, 13, 2)
-        # Sequencer jsr logic
-        jsr     = self.getBits(word, 15, 1)
-        # Din for sequencers
-        dest    = self.getBits(word, 16, 11)
-        # Stack control for sequencers
-        fe      = self.getBits(word, 27, 1)
-        pup     = self.getBits(word, 28, 1)
-        # S1, S0 lines of sequencers are derived using some extra logic
-        seq0_s  = self.getBits(word, 29, 2) ^ 3 # U_L6A, U_L6D        
-        sh0     = self.getBits(word, 31, 1) ^ 1 # U_K6A
-        mw_c40  = self.getBits(word, 32, 1)
-        # Switch statement and condition selector
-        case_   = self.getBits(word, 33, 1)
-        # Note that 'cond' reuses middle 4 bits of 'dest'
-        cond    = self.getBits(word, 20, 4)
-        # ALU control
-        aluSrc  = self.getBits(word, 34, 3)
-        aluOp   = self.getBits(word, 37, 3)
-        aluDest = self.getBits(word, 40, 3)
-        aluB    = self.getBits(word, 43, 4)
-        aluA    = self.getBits(word, 47, 4)
-        # ALU.CARRY_IN and shift select
-        u_f6    = self.getBits(word, 51, 2)
-        # U_D101A, LSB access for 16-bit register
-        r16_lsb = self.getBits(word, 53, 1)
-        # Extra bit for sequencer control, see below
-        mw_a6   = self.getBits(word, 54, 1)
-        # Register bank selector (explicit or CPL)
-        mw_a7   = self.getBits(word, 55, 1)
-
-        # S inputs for sequencers
-        s21  = mw_c40 ^ 1           # U_K6B
-        s11  = mw_a6 & (mw_c40 ^ 1) # U_J6C, U_K6D, U_K6C
-        s1s0 = (s21 << 9) | (sh0 << 8) | (s11 << 5) | (sh0 << 4) | seq0_s
+        self.printLabels(addr)
+        # Everything but the sequencer code only depends on the word itself,
+        # and quite a few words occur more than once in the ROM
+        columns = self.wordCache.get(word)
+        if columns is None:
+            columns = self.decodeColumns(addr)
+            self.wordCache[word] = columns
+
+        f = self.fields
+        seqCode, next = self.getSeqCode(addr + 1, f['dest'][addr], f['s1s0'][addr], f['fe'][addr], f['pup'][addr],
+                                        f['case_'][addr], f['cond'][addr], f['jsr'][addr])
+
+        row = ' '.join((self.addrStr[addr], columns, seqCode))
+        self.out.append(row)
+        return next
 
-        self.selects[s1s0] += 1
+    # Decode all the columns of the microword at 'addr' up to, but not including, the sequencer one
+    def decodeColumns(self, addr):
+        f = self.fields
+        d2d3    = f['d2d3'][addr]
+        e6      = f['e6'][addr]
+        k11     = f['k11'][addr]
+        h11     = f['h11'][addr]
+        e7      = f['e7'][addr]
+        dest    = f['dest'][addr]
+        aluSrc  = f['aluSrc'][addr]
+        aluOp   = f['aluOp'][addr]
+        aluDest = f['aluDest'][addr]
+        aluB    = f['aluB'][addr]
+        aluA    = f['aluA'][addr]
+        u_f6    = f['u_f6'][addr]
+        r16_lsb = f['r16_lsb'][addr]
+        mw_a7   = f['mw_a7'][addr]
 
-        seqCode, next = self.getSeqCode(addr + 1, dest, s1s0, fe, pup, case_, cond, jsr)
         dpBus   = self.getDPBus(d2d3, dest, mw_a7)
-        aluCIn  = self.getALUCIn(u_f6)
+        aluCIn  = CARRY_MAP[u_f6]
         aluCode = self.getALUCode(aluSrc, aluOp, aluDest, aluA, aluB, u_f6)
-        bus     = self.getBusCtl(h11)
-        extra   = self.getBusExtra(e7)
+        bus     = BUS_MAP[h11]
+        extra   = EXTRA_F_MAP[e7]
         fBus    = self.getFBus(e6, dest)
         write   = self.getWriteControl(k11, aluB, mw_a7)
-        msb     = 'LSB' if r16_lsb else ''
+        msb     = LSB_MAP[r16_lsb]
 
-        print(f'{addr:3x}: {dpBus:19s} {aluCIn:9s} {aluCode:40s} {fBus:51s} {bus:11s} {extra:11s} {write:20s} {msb:7s} {seqCode}')
-        return next
+        return ' '.join((dpBus, aluCIn, aluCode, fBus, bus, extra, write, msb))
 
     def printHeader(self):
-        # Reuse formatting string from above, this makes it easier to adjust it
+        # LINE_FORMAT uses the same column widths as the disassembly, so the columns always line up
         addr    = 'Addr'
         dpBus   = 'DP'
         aluCIn  = 'ALUCIn'
@@ -162,19 +353,19 @@ class MicroCode(object):
         write   = 'WriteCtl'
         msb     = 'R16_LSB'
         seqCode = 'Seq'
-        print(f'{addr:4s} {dpBus:19s} {aluCIn:9s} {aluCode:40s} {fBus:51s} {bus:11s} {extra:11s} {write:20s} {msb:7s} {seqCode}')
+        self.out.append(LINE_FORMAT % (addr, dpBus, aluCIn, aluCode, fBus, bus, extra, write, msb, seqCode))
 
 
     # Collect our switch targets, except #0, and insert them into todo list
     # Insertion happens in the beginning in reverse order, so that branches would be
     # disassembled immediately after our routine ends
     def getSwitchTargets(self, target, step):
-        for i in range(0, 3):
-            # Reverse our range: 3 2 1
-            # Skip 0 because our caller will try to continue from there
-            i = 3 - i
-            addr = target|(step * i)
-            self.entries.insert(0, addr)
+        # Reverse our range: 3 2 1
+        # Skip 0 because our caller will try to continue from there
+        entries = self.entries
+        entries.appendleft(target | (step * 3))
+        entries.appendleft(target | (step * 2))
+        entries.appendleft(target | step)
 
     def getRange(self, base, mask):
         targets = set()
@@ -184,11 +375,50 @@ class MicroCode(object):
         for addr in sorted(targets):
             self.entries.append(addr)
 
+    # Split s1s0 into masks of address nibbles coming from every source:
+    # (AR, stack, constant, uPC, dest). Every sequencer drives one nibble.
+    def decodeSelects(self, s1s0):
+        ar_mask   = 0
+        pop_mask  = 0
+        next_mask = 0
+        dest_mask = 0
+
+        bits = s1s0 & 3
+        if bits == 0:
+            next_mask |= 0x00f
+        elif bits == 1:
+            ar_mask |= 0x00f
+        elif bits == 2:
+            pop_mask |= 0x00f
+        else: # bits == 3
+            dest_mask |= 0x00f
+
+        bits = (s1s0 >> 4) & 3
+        if bits == 0:
+            next_mask |= 0x0f0
+        elif bits == 1:
+            ar_mask |= 0x0f0
+        elif bits == 2:
+            pop_mask |= 0x0f0
+        else: # bits == 3
+            dest_mask |= 0x0f0
+
+        bits = (s1s0 >> 8) & 3
+        if bits == 0:
+            next_mask |= 0xf00
+        elif bits == 1:
+            ar_mask |= 0xf00
+        elif bits == 2:
+            pop_mask |= 0xf00
+        else: # bits == 3
+            dest_mask |= 0xf00
+
+        return ar_mask, pop_mask, next_mask | dest_mask, next_mask, dest_mask
+
     def getSeqCode(self, next, dest, s1s0, fe, pup, case_, cond, jsr):
         if jsr == 0:
-            JSR_COND = ['Cycle', 'RegIdx & 0x11 == 0', 'RegIdx & 1', 'REG_MMIO', 'RegOrPageOut', 'DMARequest', 'MemFault', 'MultiINT']
-            cond = JSR_COND[dest & 7]
-            jsr_ = f'if {cond} jsr {dest:x}'
+            jsrCond = JSR_COND[dest & 7]
+            jsr_ = f'if {jsrCond} jsr {dest:x}'
             self.entries.append(dest)
             if s1s0 == 0x000:
                 return jsr_, next
@@ -213,24 +443,11 @@ class MicroCode(object):
                 jump = 'jump STK0'
             next = None
         else:
-            ar_mask    = 0;
-            pop_mask   = 0;
-            const_mask = 0;
-            target     = 0;
-
-            for i in range(0, 3):
-                bits = (s1s0 >> (i * 4)) & 3
-                mask = 0xf << (i * 4)
-                if bits == 0:
-                    target |= next & mask
-                    const_mask |= mask
-                elif bits == 1:
-                    ar_mask |= mask
-                elif bits == 2:
-                    pop_mask |= mask
-                else: # bits == 3
-                    target |= dest & mask
-                    const_mask |= mask
+            ar_mask, pop_mask, const_mask, next_mask, dest_mask = self.seqMasks[s1s0]
+            target   = (next & next_mask) | (dest & dest_mask)
+            jump     = ''
+            # Modifiers to append to the jump
+            suffixes = []
 
             if case_ == 1:
                 if push != '':
@@ -243,116 +460,74 @@ class MicroCode(object):
             elif const_mask & 0x00f == 0:
                 # Since the switch is OR-based, we need the less significant 4 bits
                 # to have a known base value, so we always take them from a constant
-                jump += ' !WARN unexpected switch'
-            # The first 4 branches use OR lines 0 and 1 via U_J13
-            elif cond == 0b1100:
-                jump = f'switch flags(ZM) jump ({target|0:x}, {target|1:x}, {target|2:x}, {target|3:x})'
-                self.getSwitchTargets(target, 1)
-                next = target
-            elif cond == 0b1101:
-                jump = f'switch flags(VH) jump ({target|0:x}, {target|1:x}, {target|2:x}, {target|3:x})'
-                self.getSwitchTargets(target, 1)
-                next = target
-            elif cond == 0b1110:
-                jump = f'switch pagetable??? jump ({target|0:x}, {target|1:x}, {target|2:x}, {target|3:x})'
-                self.getSwitchTargets(target, 1)
-                next = target
-            # These branches use OR lines 2 and 3 via U_K13
-            elif cond == 0b0011:
-                jump = f'switch flags(IL) jump ({target|0:x}, {target|4:x}, {target|8:x}, {target|12:x})'
-                self.getSwitchTargets(target, 4)
-                next = target
-            elif cond == 0b0111:
-                jump = f'switch interrupts??? jump ({target|0:x}, {target|4:x}, {target|8:x}, {target|12:x})'
-                self.getSwitchTargets(target, 4)
-                next = target
-            elif cond == 0b1011:
-                jump = f'switch dma??? jump ({target|0:x}, {target|4:x}, {target|8:x}, {target|12:x})'
-                self.getSwitchTargets(target, 4)
+                suffixes.append(' !WARN unexpected switch')
+            elif cond in SWITCH_MAP:
+                name, step = SWITCH_MAP[cond]
+                jump = f'switch {name} jump ({target:x}, {target|step:x}, {target|(step * 2):x}, {target|(step * 3):x})'
+                self.getSwitchTargets(target, step)
                 next = target
             # Combined switches don't make sense
             else:
-                jump += f'!WARN bad switch {cond:x}'
+                suffixes.append(f'!WARN bad switch {cond:x}')
 
             if pop_mask != 0:
-                jump += f'|(STK0 & {pop_mask:x})'
+                suffixes.append(f'|(STK0 & {pop_mask:x})')
 #                self.getRange(next, pop_mask)
                 next = None
             if ar_mask != 0:
-                jump += f'|(SAR & {ar_mask:x})'
+                suffixes.append(f'|(SAR & {ar_mask:x})')
 #                self.getRange(next, ar_mask)
                 next = None
 
             if fe == 0 and pup == 0:
-                jump += '; pop'
+                suffixes.append('; pop')
+            if suffixes:
+                jump = ''.join([jump] + suffixes)
 
-        op = jsr_ + push
-        if op == '':
+        if not jsr_ and not push:
             return jump, next
         if jump == '':
-            return op, next
+            return jsr_ + push, next
         sep = '; ' if push else ''
-        return op + sep + jump, next
+        return ''.join((jsr_, push, sep, jump)), next
 
     def getDPBus(self, d2d3, dest, mw_a7):
-        # 'dest' is also used for constants, but these are inverted
-        constant = ~dest & 0xff
-        if d2d3 == 0:
-            return 'READ.SWP'
-        elif d2d3 == 1:
-            return 'READ.' + self.getRegName(mw_a7)
-        elif d2d3 == 2:
-            return 'READ.MAR.H'
-        elif d2d3 == 3:
-            return 'READ.MAR.L'
-        elif d2d3 == 4:
-            return 'READ.SWP  '
-        elif d2d3 == 5:
-            return 'READ.' + self.getRegName(mw_a7)
-        elif d2d3 == 6:
-            return 'READ.MAR.H'
-        elif d2d3 == 7:
-            return 'READ.MAR.L'
-        elif d2d3 == 8:
-            return 'READ.PF'
-        elif d2d3 == 9:
-            return 'READ.CCR'
-        elif d2d3 == 10:
-            return 'READ.D.BUS'
-        elif d2d3 == 11:
-            return 'READ.MSR'
-        elif d2d3 == 12:
-            return 'READ.INR'
-        elif d2d3 == 13:
-            return f'READ.CONST:{constant:02x}'
-        elif d2d3 == 14:
-            return ''
-        elif d2d3 == 15:
-            return ''
-
+        dpBus = DP_BUS_MAP[d2d3]
+        if dpBus is not None:
+            return dpBus
+        if d2d3 == 13:
+            # 'dest' is also used for constants, but these are inverted
+            return f'READ.CONST:{~dest & 0xff:02x}'.ljust(DP_WIDTH)
+        return ('READ.' + REG_FILE_MAP[mw_a7]).ljust(DP_WIDTH)
+
+    # ALU decoding is pure and only a small part of its input space is used
+    # by the ROM, so every distinct combination is only decoded once
     def getALUCode(self, aluSrc, aluOp, aluDest, aluA, aluB, u_f6):
-        ALU_SRC_MAP = [['A', 'Q'], ['A', 'B'], ['0', 'Q'], ['0', 'B'], ['0', 'A'], ['D', 'A'], ['D', 'Q'], ['D', '0']]
-        ALU_OP_MAP = ['{r}+{s}', '{s}-{r}', '{r}-{s}', '{r}|{s}', '{r}&{s}', '(~{r})&{s}', '{r}^{s}', '~({r}^{s})']
-        ALU_MEM_DEST_MAP = [''     , ''     , 'r{b}={f}', 'r{b}={f}', 'r{b}=({f})>>1', 'r{b}=({f})>>1', 'r{b}=({f})<<1', 'r{b} =({f})<<1']
-        ALU_Q_DEST_MAP   = ['Q={f}', ''     , ''        , ''        , 'Q>>=1'        , ''             , 'Q<<=1'        , ''              ]
-        ALU_OUT_MAP      = ['Y={f}', 'Y={f}', 'Y={a}'   , 'Y={f}'   , 'Y={f}'        , 'Y={f}'        , 'Y={f}'        , 'Y={f}'         ]
-
+        key = (aluSrc, aluOp, aluDest, aluA, aluB, u_f6)
+        aluCode = self.aluCache.get(key)
+        if aluCode is None:
+            aluCode = self.decodeALUCode(*key).ljust(ALU_OP_WIDTH)
+            self.aluCache[key] = aluCode
+        return aluCode
+
+    def decodeALUCode(self, aluSrc, aluOp, aluDest, aluA, aluB, u_f6):
         cin = 0
         cout = 0
         r, s = ALU_SRC_MAP[aluSrc]
+        a = REG_NAMES[aluA]
+        b = REG_NAMES[aluB]
         if r == 'A':
-            r = f'r{aluA}'
+            r = a
         elif r == 'B':
-            r = f'r{aluB}'
+            r = b
         if s == 'A':
-            s = f'r{aluA}'
+            s = a
         elif s == 'B':
-            s = f'r{aluB}'
-        f = ALU_OP_MAP[aluOp].format(r=r, s=s)
-        mem = ALU_MEM_DEST_MAP[aluDest].format(b=aluB, f=f)
-        q = ALU_Q_DEST_MAP[aluDest].format(f=f)
-        a = f'r{aluA}'
-        y = ALU_OUT_MAP[aluDest].format(f=f, a=a)
+            s = b
+        f = ALU_OP_MAP[aluOp](r, s)
+        mem = ALU_MEM_DEST_MAP[aluDest](b, f)
+        q = ALU_Q_DEST_MAP[aluDest](f)
+        y = ALU_OUT_MAP[aluDest](f, a)
         c = ''
         if cout:
             c = 'C'
@@ -372,100 +547,46 @@ class MicroCode(object):
     def getFBus(self, val, dest):
         if val == 7:
             # CCR write uses 'dest' as flag selector
-            sz_sel       = self.getBits(dest, 0, 2)
-            fault_enable = self.getBits(dest, 2, 1)
-            fault_sel    = self.getBits(dest, 3, 2)
-            link_enable  = self.getBits(dest, 5, 1)
-            link_sel     = self.getBits(dest, 6, 3)
+            sz_sel       = dest & MASK2
+            fault_enable = (dest >> 2) & MASK1
+            fault_sel    = (dest >> 3) & MASK2
+            link_enable  = (dest >> 5) & MASK1
+            link_sel     = (dest >> 6) & MASK3
 
-            sign  = self.getSignSel(sz_sel)
-            zero  = self.getZeroSel(sz_sel)
-            link  = self.getLinkSel(link_enable, link_sel)
-            fault = self.getFaultSel(fault_enable, fault_sel)
+            sign  = SIGN_TABLE[sz_sel]
+            zero  = ZERO_TABLE[sz_sel]
+            link  = '0' if link_enable else LINK_TABLE[link_sel]
+            fault = '0' if fault_enable else FAULT_TABLE[fault_sel]
 
-            return 'LOAD.CCR{' + f'V={zero},M={sign},F={fault},L={link}' + '}'
+            return ('LOAD.CCR{' + f'V={zero},M={sign},F={fault},L={link}' + '}').ljust(F_WIDTH)
 
-        RESULT_MAP = ['        ', "LOAD.RR ", "LOAD.RIR", "LOAD.ILR", "LOAD.MAP", "LOAD.MAR", "LOAD.SAR"]
         return RESULT_MAP[val]
 
-    # U_F6
-    def getALUCIn(self, u_f6):
-        CARRY_MAP = ['0', '1', 'FLR.C', '0']
-        return CARRY_MAP[u_f6]
-
     # U_H6
     def getShiftSel(self, shift_up, u_f6):
         if shift_up:
             # Left shift, select which signal will be shifted in at LSB
-            SHIFT_Q0_MAP = ['0', 'FLR.C', 'ALU.S', '1']
             val = SHIFT_Q0_MAP[u_f6]
             signal = 'Q0'
         else:
             # Right shift, select which signal will be shifted in at MSB
-            SHIFT_RAM7_MAP = ['ALU.S', 'FLR.C', 'ALU.Q0', 'ALU.C']
             val = SHIFT_RAM7_MAP[u_f6]
             signal = 'RAM7'
         return f'{signal}={val}'
 
-    # U_J12.a
-    def getSignSel(self, sel):
-        SIGN_TABLE = ['CCR.M', 'FLR.S', 'RR.D6', 'FLR.S']
-        return SIGN_TABLE[sel]
-
-    # U_J12.b
-    def getZeroSel(self, sel):
-        ZERO_TABLE = ['CCR.V', 'FLR.Z', 'RR.D7', 'FLR.Z&FLR.LZ']
-        return ZERO_TABLE[sel]
-
-    # U_J10
-    def getLinkSel(self, enable, sel):
-        if enable:
-            return '0'
-        else:
-            LINK_TABLE = ['CCR.L', '/CCR.L', 'FLR.C', '1', 'RR.D4', 'ALU.SHIFT_RAM7', 'ALU_SHIFT_RAM0_Q7', 'ALU.SHIFT_Q0']
-            return LINK_TABLE[sel]
-
-    #U_J11
-    def getFaultSel(self, enable, sel):
-        if enable:
-            return '0'
-        else:
-            FAULT_TABLE = ['RR.D5', '1', 'CCR.F', 'FLR.OVER']
-            return FAULT_TABLE[sel]
-        
-    # U_C14
-    def getRegName(self, mw_a7):
-        if mw_a7:
-            return 'RF[RIR.L][ILR]'
-        else:
-            return 'RF[RIR]'
-
-    # U_H11
-    def getBusCtl(self, h11):
-        BUS_MAP = ['', 'BUS.RD', 'BUS.WT', 'LOAD.WAR.H', 'INC.WAR', 'INC.MAR', 'MAPROM.EN', 'LOAD.SWP']
-        return BUS_MAP[h11]
-
-    # U_E7
-    def getBusExtra(self, u_e7):
-        EXTRA_F_MAP = ['', 'BUS.ABT', 'LOAD.FLR', 'BUS.WAIT']
-        return EXTRA_F_MAP[u_e7]
-
     # U_K11, U_K12C, U_H13B
     def getWriteControl(self, k11, aluB, mw_a7):
         if k11 == 2: # U_M13
-            M13_MAP = ['CTL0.DMA', 'CTL1.DMA', 'TIMER', 'MAPROM.CE1', 'RUN', '/TIMER.RES', 'ABORT', 'IACK']
-            return self.getDemuxedControl(M13_MAP, aluB)
+            return self.getDemuxedControl(M13_MAP, aluB).ljust(WRITE_WIDTH)
         if k11 == 3: # U_F11
-            F11_MAP = ['INT', '/ABE', '/INC.DMA', 'DIR', '/DMA', 'PARO', 'PE.EN', 'DMA.EN']
-            return self.getDemuxedControl(F11_MAP, aluB)
+            return self.getDemuxedControl(F11_MAP, aluB).ljust(WRITE_WIDTH)
         if k11 == 4: # Write from result register to register file
-            reg = self.getRegName(mw_a7)
-            return f'WRITE.{reg}'
+            reg = REG_FILE_MAP[mw_a7]
+            return f'WRITE.{reg}'.ljust(WRITE_WIDTH)
 
         # M13, F11 and REGS are handled above
-        WRITE_CONTROL = ['', 'DMA.RESET', 'M13.EN?', 'F11.EN?', 'WRITE.RF', 'WRITE.PF', 'LOAD.WAR.L', 'LOAD.DBR']
         # TODO: BusCtl uses numeric value from aluB (U_F11)
-        return WRITE_CONTROL[k11]
+        return WRITE_CONTROL[k11].ljust(WRITE_WIDTH)
 
     def getDemuxedControl(self, map_, aluB):
         bit  = '+' if aluB & 1 == 1 else '-'